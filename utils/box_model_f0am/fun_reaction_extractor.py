@@ -1,6 +1,113 @@
+import mmap
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import pandas as pd
-import numpy as np
+
+_WORD_RE = re.compile(r'\w+')
+# Stoichiometry line template, filled with (species, sign, coefficient)
+_STOICH_LINE = "f{0}(i) = f{0}(i) {1} {2};"
+# Photolysis rates are written as "PF=<name>" with an optional "QY=<yield>"
+_PHOTOLYSIS_RE = re.compile(r'PF=(?P<pf>\S+)(?:.*?QY=(?P<qy>[0-9.eE\-]+))?')
+
+
+def _is_word_char(char):
+    """Return True if char counts as a word character for regex \\b."""
+    return char.isalnum() or char == '_'
+
+
+def _contains_word(text, name):
+    """
+    Check whether name occurs in text between word boundaries.
+
+    Equivalent to re.search(r'\\b' + re.escape(name) + r'\\b', text), using
+    plain substring search so that the run time stays linear in the text.
+
+    Parameters:
+        text (str): Text to search.
+        name (str): Non-empty name to look for.
+
+    Returns:
+        bool: True if name is found as a whole word.
+    """
+    first_is_word = _is_word_char(name[0])
+    last_is_word = _is_word_char(name[-1])
+    pos = text.find(name)
+    while pos != -1:
+        end = pos + len(name)
+        before_is_word = pos > 0 and _is_word_char(text[pos - 1])
+        after_is_word = end < len(text) and _is_word_char(text[end])
+        if before_is_word != first_is_word and after_is_word != last_is_word:
+            return True
+        pos = text.find(name, pos + 1)
+    return False
+
+
+def _find_sections(mm):
+    """
+    Locate the marked sections of a memory-mapped MechGen output file.
+
+    A section starts at a bare marker line (e.g. ".ACT", ".STS", ".RXN") and
+    ends at the next marker line, with "." closing a section.
+
+    Parameters:
+        mm (mmap): Read-only map of the MechGen output file.
+
+    Returns:
+        list: (marker, start, end) byte offsets of each section body, in file order.
+    """
+    sections = []
+    section, start = None, 0
+    eol = -1
+    while True:
+        # Marker lines are the lines starting with '.'
+        if eol == -1 and mm[:1] == b'.':
+            pos = 0
+        else:
+            pos = mm.find(b'\n.', max(eol, 0)) + 1
+            if not pos:
+                break
+        eol = mm.find(b'\n', pos)
+        if eol == -1:
+            eol = len(mm)
+        if section is not None:
+            sections.append((section, start, pos))
+        marker = mm[pos:eol].rstrip().decode()
+        section = None if marker == '.' else marker
+        start = min(eol + 1, len(mm))
+    if section is not None:
+        sections.append((section, start, len(mm)))
+    return sections
+
+
+def _iter_sections(file_path, select=None):
+    """
+    Stream the lines of a MechGen output file together with their section.
+
+    The file is memory-mapped and only the bodies of the selected sections
+    are read. Lines outside of any section and the marker lines themselves
+    are not yielded.
+
+    Parameters:
+        file_path (str): Path to the MechGen output file.
+        select (callable): Optional filter on section markers; rejected
+            sections are skipped without being read.
+
+    Yields:
+        tuple: (section, line) where section is the active marker.
+    """
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for section, start, end in _find_sections(mm):
+                if select is not None and not select(section):
+                    continue
+                mm.seek(start)
+                while mm.tell() < end:
+                    yield section, mm.readline().decode()
+
 
 class SpeciesExtractor:
     """
@@ -8,7 +115,68 @@ class SpeciesExtractor:
     """
     
     @staticmethod
-    def extract_species(file_path, string_start, string_end):
+    def tokenize_species(file_path):
+        """
+        Tokenize all species sections of the MechGen output file in one pass.
+
+        Parameters:
+            file_path (str): Path to the MechGen output file.
+
+        Returns:
+            sections (dict): Section markers mapped to lists of
+                (MGName, Species) tuples, in file order.
+        """
+        sections = {}
+
+        # Record every marker, including .RXN and empty sections, so that
+        # select_species can stop at any of them as an end marker
+        def select(marker):
+            sections.setdefault(marker, [])
+            return marker != '.RXN'
+
+        for section, line in _iter_sections(file_path, select):
+            entries = sections[section]
+            # Skip blank lines and lines whose first token is a comment or marker
+            stripped = line.lstrip()
+            if not stripped or stripped[0] in '!.':
+                continue
+            mgname, _, rest = line.partition('!')
+            name = rest.rsplit(None, 1)[-1] if rest.strip() else ''
+            entries.append((mgname.split(' ', 1)[0], name))
+        return sections
+
+    @staticmethod
+    def select_species(file_path, string_start, string_end, sections=None):
+        """
+        Yield the tokenized species between two section markers.
+
+        Parameters:
+            file_path (str): Path to the MechGen output file.
+            string_start (str): Starting line of the target species.
+            string_end (str): Ending line of the target species.
+            sections (dict): Optional output of tokenize_species, to avoid
+                re-reading the file.
+
+        Yields:
+            tuple: (MGName, Species) for each species, in file order.
+        """
+        if sections is None:
+            sections = SpeciesExtractor.tokenize_species(file_path)
+        if string_start not in sections:
+            raise ValueError(f"Section {string_start} not found in {file_path}")
+
+        # Collect the sections between the start and end markers
+        collecting = False
+        for marker, entries in sections.items():
+            if marker == string_end:
+                break
+            if marker == string_start:
+                collecting = True
+            if collecting:
+                yield from entries
+
+    @staticmethod
+    def extract_species(file_path, string_start, string_end, sections=None):
         """
         Extracts MechGen species from the MechGen output file.
 
@@ -16,28 +184,19 @@ class SpeciesExtractor:
             file_path (str): Path to the MechGen output file.
             string_start (str): Starting line of the target species.
             string_end (str): Ending line of the target species.
+            sections (dict): Optional output of tokenize_species, to avoid
+                re-reading the file.
 
         Returns:
             df_species (DataFrame): A dataframe of extracted species with columns:
                 - Species: Species names
                 - MGName: MechGen names
         """
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-
-        # Find the start and end indices of the section
-        start_index = lines.index(f'{string_start}\n') + 1
-        end_index = lines.index(f'{string_end}\n')
-
-        # Extract species
         list_mgname = []
         list_species = []
-        for line in lines[start_index:end_index]:
-            if not line.split()[0].startswith("!") and not line.split()[0].startswith("."): 
-                mgname = line.split('!')[0].split(' ')[0]
-                name = line.split('!')[1].split('\n')[0].split(' ')[-1]
-                list_mgname.append(mgname)
-                list_species.append(name)
+        for mgname, name in SpeciesExtractor.select_species(file_path, string_start, string_end, sections):
+            list_mgname.append(mgname)
+            list_species.append(name)
      
         # Create and clean DataFrame
         df_species = pd.DataFrame({
@@ -50,6 +209,28 @@ class SpeciesExtractor:
           
         return df_species
 
+    @staticmethod
+    def extract_species_mgnames(file_path, string_start, string_end, sections=None):
+        """
+        Extracts the MechGen names of unique species from the MechGen output file.
+
+        Same selection as extract_species, without building a DataFrame.
+
+        Parameters:
+            file_path (str): Path to the MechGen output file.
+            string_start (str): Starting line of the target species.
+            string_end (str): Ending line of the target species.
+            sections (dict): Optional output of tokenize_species, to avoid
+                re-reading the file.
+
+        Returns:
+            list: MechGen names, first occurrence of each species kept.
+        """
+        seen = {}
+        for mgname, name in SpeciesExtractor.select_species(file_path, string_start, string_end, sections):
+            seen.setdefault(name, mgname)
+        return list(seen.values())
+
     @staticmethod
     def build_compounds(input_file, default_compounds):
         """
@@ -65,17 +246,13 @@ class SpeciesExtractor:
                 compounds_sts: list of species from the ".STS" file.
         """
         # Extract species from STS and ACT files
-        df_sts = SpeciesExtractor.extract_species(input_file, ".STS", ".RXN")
-        compounds_sts = df_sts["MGName"].tolist()
-
-        df_act = SpeciesExtractor.extract_species(input_file, ".ACT", ".RXN")
-        compounds_act = df_act["MGName"].tolist()
+        sections = SpeciesExtractor.tokenize_species(input_file)
+        compounds_sts = SpeciesExtractor.extract_species_mgnames(input_file, ".STS", ".RXN", sections)
+        compounds_act = SpeciesExtractor.extract_species_mgnames(input_file, ".ACT", ".RXN", sections)
 
         # Exclude default and STS species from ACT list
-        compounds_act = [
-            comp for comp in compounds_act
-            if comp not in default_compounds and comp not in compounds_sts
-        ]
+        excluded = set(default_compounds).union(compounds_sts)
+        compounds_act = [comp for comp in compounds_act if comp not in excluded]
 
         # Process all compounds
         compounds_total = default_compounds + compounds_act + compounds_sts
@@ -97,12 +274,26 @@ class SpeciesExtractor:
                 - filtered_compounds: Compounds present in reactions.
                 - dropped_compounds: Compounds NOT found in reactions.
         """
-        combined_reactions = " ".join(reaction_list)
-        pattern = r'\b(?:' + '|'.join(re.escape(comp) for comp in compound_list) + r')\b'
-        found_compounds = set(re.findall(pattern, combined_reactions))
+        # Whole-word keyword lookup: a compound made of word characters can
+        # only match a complete word of a reaction, so strike the words of
+        # each reaction off the set of compounds not yet found
+        missing_compounds = set(compound_list)
+        others = [comp for comp in missing_compounds if comp and not _WORD_RE.fullmatch(comp)]
+        for reaction in reaction_list:
+            missing_compounds.difference_update(_WORD_RE.findall(reaction))
+
+            # Names with non-word characters are searched one by one
+            for comp in others:
+                if comp in missing_compounds and _contains_word(reaction, comp):
+                    missing_compounds.discard(comp)
+
+            if not missing_compounds:
+                break
         
-        filtered_compounds = [comp for comp in compound_list if comp in found_compounds]
-        dropped_compounds = [comp for comp in compound_list if comp not in found_compounds]
+        filtered_compounds, dropped_compounds = [], []
+        keep, drop = filtered_compounds.append, dropped_compounds.append
+        for comp in compound_list:
+            (drop if comp in missing_compounds else keep)(comp)
         
         return filtered_compounds, dropped_compounds
 
@@ -113,45 +304,48 @@ class ReactionExtractor:
     """
     
     @staticmethod
-    def parse_reactions(file_path):
+    def iter_reactions(file_path):
         """
-        Extract reaction strings from MechGen output file.
+        Stream reaction strings from MechGen output file.
+
+        Multi-line reactions are assembled as the file is read, so only the
+        current reaction is held in memory.
 
         Parameters:
             file_path (str): Path to the MechGen output file.
 
-        Returns:
-            list: List of extracted reaction strings.
-        """    
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-
-        # Find reaction section boundaries
-        rxn_start_index = lines.index('.RXN\n') + 1
-        try:
-            rxn_end_index = lines.index('.\n', rxn_start_index)
-        except ValueError:
-            rxn_end_index = len(lines)
-
-        reactions = []
-        current_reaction = ""
+        Yields:
+            str: One reaction string at a time, in file order.
+        """
+        current_parts = []
 
         # Process reaction lines
-        for line in lines[rxn_start_index:rxn_end_index]:
+        for _, line in _iter_sections(file_path, lambda marker: marker == '.RXN'):
             line = line.strip().replace('#', '')
             if line.startswith('R)'):  # New reaction
-                if current_reaction:
-                    reactions.append(current_reaction)
-                current_reaction = line
+                if current_parts:
+                    yield ' '.join(current_parts)
+                current_parts = [line]
             else:
                 # Continuation line
-                current_reaction += ' ' + line
+                current_parts.append(line)
 
         # Add final reaction
-        if current_reaction:
-            reactions.append(current_reaction)
+        if current_parts:
+            yield ' '.join(current_parts)
 
-        return reactions
+    @staticmethod
+    def parse_reactions(file_path):
+        """
+        Extract reaction strings from MechGen output file.
+
+        Parameters:
+            file_path (str): Path to the MechGen output file.
+
+        Returns:
+            list: List of extracted reaction strings.
+        """    
+        return list(ReactionExtractor.iter_reactions(file_path))
 
     @staticmethod
     def handle_photolysis(value, names_PF):
@@ -166,16 +360,15 @@ class ReactionExtractor:
             str: Processed rate string.
         """        
         if 'PF=' in value:
-            product_match = re.search(r'PF=([^\s]+)', value)
-            yield_match = re.search(r'QY=([0-9\.eE\-]+)', value)
-            if product_match:
-                product_name = product_match.group(1).replace('-', '_')
+            match = _PHOTOLYSIS_RE.search(value)
+            if match:
+                product_name = match.group('pf').replace('-', '_')
                 if product_name == 'C2CHOabs':
                     product_name = 'C2CHO'
                 if product_name not in names_PF:
                     names_PF.append(product_name)
-                if yield_match:
-                    yield_value = yield_match.group(1)
+                yield_value = match.group('qy')
+                if yield_value:
                     return f"{product_name} * {yield_value}"
                 return f"{product_name}"
         return value
@@ -242,7 +435,83 @@ class ReactionExtractor:
         return reactant_equations
 
     @staticmethod
-    def format_for_f0am(gen, precursor, compounds, reactions, para_soa=False, radical_cutoff=False, reference_reactions=None):
+    def format_reaction(reaction_info, reaction_eqn, radical_start_string, para_soa=False):
+        """
+        Format the body of a single reaction for F0AM input.
+
+        Parameters:
+            reaction_info (str): Rate part of the reaction string ("R) ...").
+            reaction_eqn (str): Reaction equation with MATLAB-safe names.
+            radical_start_string (str): Label prefix of the RO2 species.
+            para_soa (bool): Flag for SOA parameterization.
+
+        Returns:
+            tuple: (reaction_body, names_PF) where:
+                reaction_body: MATLAB-formatted reaction block, without the index header.
+                names_PF: List of photolysis product names used by the rate.
+        """
+        # Format reaction rate
+        names_PF = []
+        rate_start = reaction_info.find('R)') + 2
+        reaction_rate = reaction_info[rate_start:].strip()
+        formatted_rate = ReactionExtractor.format_rate(reaction_rate, names_PF)
+
+        # Split reactants and products
+        reactant_part, product_part = reaction_eqn.split('=')
+        reactants = [r.strip() for r in reactant_part.split('+')]
+        product_entries = [p.strip() for p in product_part.split('+')]
+
+        # Build MATLAB reaction components
+        increment_i = "i = i + 1;"
+        rnames_line = f"Rnames{{i}} = '{reaction_eqn}';"
+        rate_line = f"k(:,i) = {formatted_rate};"
+        
+        # Reactant strings
+        gstr_lines = ''.join(
+            f"Gstr{{i,{idx}}} = '{reactant}'; " 
+            for idx, reactant in enumerate(reactants, start=1) 
+            if reactant != "HV"
+        )
+        
+        # Build stoichiometry coefficients as (species, sign, coefficient)
+        f_terms = []
+        # Reactant coefficients
+        for reactant in reactants:
+            if reactant != "HV":
+                f_terms.append((reactant, '-', 1))
+                if reactant.startswith(radical_start_string):
+                    f_terms.append(('RO2', '-', 1))
+        # Product coefficients
+        ro2_count = 0
+        for entry in product_entries:  
+            head, sep, tail = entry.partition(' ')
+            yield_value = 1.0
+            product = entry
+            # Only plain decimals are yields; float() alone would also take
+            # tokens such as "inf", "nan" or "1_0"
+            if sep and head.replace('.', '', 1).isdigit():
+                try:
+                    yield_value = float(head)
+                    product = tail.strip()
+                except ValueError:
+                    pass
+
+            if product:
+                if para_soa or not product.startswith('VBS'):
+                    f_terms.append((product, '+', yield_value))
+                if product.startswith(radical_start_string):
+                    ro2_count += yield_value 
+        if ro2_count > 0: 
+            f_terms.append(('RO2', '+', ro2_count))
+
+        # Combine components
+        f_lines = '\n'.join([_STOICH_LINE.format(*term) for term in f_terms])
+        reaction_body = f"{increment_i}\n{rnames_line}\n{rate_line}\n{gstr_lines}\n{f_lines}"
+        return reaction_body, names_PF
+
+    @staticmethod
+    def format_for_f0am(gen, precursor, compounds, reactions, para_soa=False, radical_cutoff=False, reference_reactions=None,
+                        workers=None):
         """
         Format reactions for F0AM input.
 
@@ -254,22 +523,20 @@ class ReactionExtractor:
             para_soa (bool): Flag for SOA parameterization.
             radical_cutoff (int/bool): Cutoff for radical generation numbers.
             reference_reactions (set): Set of reactions to exclude (from base mechanism).
+            workers (int): Number of worker processes used to format the reactions.
+                Reactions are formatted serially when None or 1.
 
         Returns:
             tuple: (formatted_reactions, names_PF) where:
                 formatted_reactions: List of MATLAB-formatted reaction strings.
                 names_PF: List of photolysis product names.
         """
-        formatted_reactions = []
-        df_reactions = pd.DataFrame(columns=['Rate','R1','R2', 
-                                           'P1','P2','P3','P4','P5',
-                                           'P6','P7','P8','P9','P10'])  
-        
         # The RO2 species label are different
         radical_start_string = f"{precursor}r" if gen == "Single" else "RAD"
         
-        i = 1  # Reaction index counter
-        names_PF = []  # Photolysis product names
+        compounds_set = set(compounds)
+        kept_info = []  # Rate parts of the reactions to format
+        kept_eqn = []   # Equations of the reactions to format
         
         for reaction in reactions:
             parts = reaction.split(';')
@@ -288,81 +555,39 @@ class ReactionExtractor:
             
             # Filter species that not defined
             species_label = reactant_part.split(' ')[0]
-            if species_label not in compounds:
+            if species_label not in compounds_set:
                 continue
 
             # Filter radicals by generation number
             if radical_cutoff:
-                if reactant_part.startswith(radical_start_string):
-                    radical_label = reactant_part.split(' ')[0]
-                    radical_number = int(''.join(filter(str.isdigit, radical_label.split('_')[-1])))
+                if species_label.startswith(radical_start_string):
+                    radical_number = int(''.join(filter(str.isdigit, species_label.split('_')[-1])))
                     if radical_number > radical_cutoff:
                         continue
                     
                 
-            # Format reaction rate
-            rate_start = reaction_info.find('R)') + 2
-            reaction_rate = reaction_info[rate_start:].strip()
-            formatted_rate = ReactionExtractor.format_rate(reaction_rate, names_PF)
-
-            # Split reactants and products
-            reactant_part, product_part = reaction_eqn.split('=')
-            reactants = [r.strip().replace('-', '_') for r in reactant_part.split('+')]
-            product_entries = [p.strip() for p in product_part.split('+')]
-
-            # Build MATLAB reaction components
+            kept_info.append(reaction_info)
+            kept_eqn.append(reaction_eqn)
+
+        # Format the reactions; each one is independent of the others
+        args = (kept_info, kept_eqn, repeat(radical_start_string), repeat(para_soa))
+        if workers is not None and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(ReactionExtractor.format_reaction, *args, chunksize=256))
+        else:
+            results = map(ReactionExtractor.format_reaction, *args)
+
+        # Number the reaction blocks and merge photolysis names in order
+        formatted_reactions = []
+        names_PF = []  # Photolysis product names
+        seen_PF = set()
+        for i, (reaction_body, reaction_PF) in enumerate(results, start=1):
             reaction_header = f"%   {i}, <R{i:03}>"
-            increment_i = "i = i + 1;"
-            rnames_line = f"Rnames{{i}} = '{reaction_eqn.replace('-', '_')}';"
-            rate_line = f"k(:,i) = {formatted_rate};"
-            
-            # Reactant strings
-            gstr_lines = ''.join(
-                f"Gstr{{i,{idx}}} = '{reactant}'; " 
-                for idx, reactant in enumerate(reactants, start=1) 
-                if reactant != "HV"
-            )
-            
-            # Populate DataFrame
-            df_reactions.at[i, 'Rate'] = formatted_rate
-            df_reactions.at[i, 'R1'] = reactants[0]  
-            if len(reactants) == 2:
-                df_reactions.at[i, 'R2'] = reactants[1] 
-            for j in range(1, 10):
-                df_reactions.at[i, f'P{j}'] = product_entries[j-1] if j <= len(product_entries) else np.nan
-
-            # Build stoichiometry coefficients
-            f_lines = []
-            # Reactant coefficients
-            for reactant in reactants:
-                if reactant != "HV":
-                    f_lines.append(f"f{reactant}(i) = f{reactant}(i) - 1;")
-                    if reactant.startswith(radical_start_string):
-                        f_lines.append("fRO2(i) = fRO2(i) - 1;")
-            # Product coefficients
-            ro2_count = 0
-            for entry in product_entries:  
-                parts = entry.split()
-                yield_value = 1.0
-                if len(parts) > 1 and parts[0].replace('.', '', 1).isdigit():
-                    yield_value = float(parts[0])
-                    product = ' '.join(parts[1:]).replace('-', '_')
-                else:
-                    product = entry.replace('-', '_')
-                    
-                if product.strip():
-                    if para_soa or not product.startswith('VBS'):
-                        f_lines.append(f"f{product}(i) = f{product}(i) + {yield_value};")
-                    if product.startswith(radical_start_string):
-                        ro2_count += yield_value 
-            if ro2_count > 0: 
-                f_lines.append(f"fRO2(i) = fRO2(i) + {ro2_count};")
-
-            # Combine components
-            formatted_reactions.append(
-                f"{reaction_header}\n{increment_i}\n{rnames_line}\n{rate_line}\n{gstr_lines}\n" + '\n'.join(f_lines)
-            )
-            i += 1
+            formatted_reactions.append(f"{reaction_header}\n{reaction_body}")
+            for name in reaction_PF:
+                if name not in seen_PF:
+                    seen_PF.add(name)
+                    names_PF.append(name)
         
         return formatted_reactions, names_PF
 
@@ -388,25 +613,32 @@ class MechanismWriter:
         """
         NUMBER_COMPOUND = 6
 
+        # Collect the output chunks and write them in one call
+        chunks = []
+
         # Write header
-        file_handle.write(f"% MechGen derived {target_reactant} explicit mechanism\n")
-        file_handle.write(f"% Default mechanism with MinYld={target_minyld}\n")
+        chunks.append(f"% MechGen derived {target_reactant} explicit mechanism\n")
+        chunks.append(f"% Default mechanism with MinYld={target_minyld}\n")
 
         # Write species block
         compounds_list = [name_replacements.get(compound, compound) for compound in compounds_list]
-        file_handle.write("SpeciesToAdd = {...\n")
+        chunks.append("SpeciesToAdd = {...\n")
         for i in range(0, len(compounds_list), NUMBER_COMPOUND):
             line_compounds = compounds_list[i:i + NUMBER_COMPOUND]
             line_text = "; ".join(f"'{comp}'" for comp in line_compounds)
             if i + NUMBER_COMPOUND >= len(compounds_list):
-                file_handle.write(line_text + ";};\n")
+                chunks.append(line_text + ";};\n")
             else:
-                file_handle.write(line_text + ";...\n")
-        file_handle.write("\nAddSpecies\n\n")
-
-        # Write reactions
-        file_handle.write("% Reactions:\n")
-        for reaction in reaction_list:
-            for old, new in name_replacements.items():
-                reaction = reaction.replace(old, new)
-            file_handle.write(reaction + "\n\n")
\ No newline at end of file
+                chunks.append(line_text + ";...\n")
+        chunks.append("\nAddSpecies\n\n")
+
+        # Write reactions. The replacements are applied in order, each one
+        # to the result of the previous ones (so e.g. "SumSum" can undo a
+        # doubled prefix), with one pass per entry over the joined text
+        chunks.append("% Reactions:\n")
+        reactions_text = ''.join(reaction + "\n\n" for reaction in reaction_list)
+        for old, new in name_replacements.items():
+            reactions_text = reactions_text.replace(old, new)
+        chunks.append(reactions_text)
+
+        file_handle.write(''.join(chunks))
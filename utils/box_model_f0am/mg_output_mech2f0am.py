@@ -88,6 +88,7 @@ def main():
         compounds_total,
         reactions,
         #radical_cutoff=2000, # 4756
+        #workers=4, # Format reactions in a process pool
         reference_reactions=reference_reactions
     )
     
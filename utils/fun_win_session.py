@@ -0,0 +1,502 @@
+"""
+Helpers shared by the MechGen setup scripts: the PuTTY and plink sessions,
+command sending, and waiting for MechGen's output files.
+"""
+
+import time
+import os
+import logging
+import ctypes
+import re
+import subprocess
+import threading
+from functools import lru_cache
+from pywinauto.application import Application
+from typing import List, Any, Optional, Tuple
+
+# Win32 directory change notifications, used to wait for output files
+kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+kernel32.FindFirstChangeNotificationW.argtypes = [ctypes.c_wchar_p, ctypes.c_bool, ctypes.c_uint32]
+kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+kernel32.WaitForSingleObject.restype = ctypes.c_uint32
+kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+FILE_NOTIFY_CHANGE_FILE_NAME = 0x0001
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x0010
+WAIT_OBJECT_0 = 0x0000
+
+# Win32 clipboard, used to paste commands into PuTTY
+user32 = ctypes.WinDLL("user32", use_last_error=True)
+user32.OpenClipboard.argtypes = [ctypes.c_void_p]
+user32.SetClipboardData.restype = ctypes.c_void_p
+user32.SetClipboardData.argtypes = [ctypes.c_uint, ctypes.c_void_p]
+kernel32.GlobalAlloc.restype = ctypes.c_void_p
+kernel32.GlobalAlloc.argtypes = [ctypes.c_uint, ctypes.c_size_t]
+kernel32.GlobalLock.restype = ctypes.c_void_p
+kernel32.GlobalLock.argtypes = [ctypes.c_void_p]
+kernel32.GlobalUnlock.argtypes = [ctypes.c_void_p]
+kernel32.GlobalFree.argtypes = [ctypes.c_void_p]
+CF_UNICODETEXT = 13
+GMEM_MOVEABLE = 0x0002
+
+
+# Braces make pywinauto's key parser send parentheses as literal characters
+SMILES_ESCAPES = str.maketrans({"(": "{(}", ")": "{)}"})
+
+# Seconds for PuTTY to read a paste before the clipboard is reused
+PASTE_DELAY = 0.1
+
+
+@lru_cache(maxsize=256)
+def escape_smiles(smiles: str) -> str:
+    """
+    Escape parentheses in the SMILES string so that pywinauto's
+    key parser interprets them as literal characters.
+    
+    Args:
+        smiles: A SMILES string.
+    
+    Returns:
+        A new SMILES string with escaped parentheses.
+    """
+    return smiles.translate(SMILES_ESCAPES)
+
+
+class Clipboard:
+    """
+    Context manager that opens the Win32 clipboard and closes it on exit.
+    
+    The clipboard has to be closed again before PuTTY can paste from it.
+    """
+    
+    def __enter__(self) -> "Clipboard":
+        if not user32.OpenClipboard(None):
+            raise ctypes.WinError(ctypes.get_last_error())
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        user32.CloseClipboard()
+    
+    def set_text(self, text: str) -> None:
+        """
+        Replace the clipboard contents with text as CF_UNICODETEXT.
+        """
+        data = text.encode("utf-16-le") + b"\0\0"
+        user32.EmptyClipboard()
+        
+        handle = kernel32.GlobalAlloc(GMEM_MOVEABLE, len(data))
+        if not handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        pointer = kernel32.GlobalLock(handle)
+        if not pointer:
+            kernel32.GlobalFree(handle)
+            raise ctypes.WinError(ctypes.get_last_error())
+        ctypes.memmove(pointer, data, len(data))
+        kernel32.GlobalUnlock(handle)
+        
+        # The clipboard owns the memory once SetClipboardData succeeds
+        if not user32.SetClipboardData(CF_UNICODETEXT, handle):
+            kernel32.GlobalFree(handle)
+            raise ctypes.WinError(ctypes.get_last_error())
+
+
+class PlinkSession:
+    """
+    A Telnet session run through plink, PuTTY's command-line client.
+    
+    Commands are written straight to plink's stdin, so nothing has to be
+    typed or pasted into a window and SMILES need no escaping. A background
+    thread keeps reading plink's output so that it never blocks on a full
+    pipe.
+    
+    Once set_output_suffix has been called, every command is sent behind
+    OUTPUTPREFIX and OUTPUTSUFFIX lines carrying its own sequence number, so
+    MOO wraps the output of command n in PREFIX n and SUFFIX n. MechGen runs
+    commands in order, so seeing the marker of the last command sent means
+    everything before it has been answered too.
+    """
+    
+    PREFIX = "-=-MECHGEN-START-{}-=-"
+    SUFFIX = "-=-MECHGEN-DONE-{}-=-"
+    SUFFIX_RE = re.compile(rb"-=-MECHGEN-DONE-(\d+)-=-")
+    SUFFIX_MAX = len(SUFFIX.format(10 ** 20))
+    
+    def __init__(self, host: str, port: int) -> None:
+        self.proc = subprocess.Popen(
+            ["plink", "-telnet", host, "-P", str(port), "-batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+        )
+        self.output = bytearray()
+        self.scan_from = 0
+        self.done = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.sent = 0
+        self.answered = 0
+        self.suffix_on = False
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+    
+    def _read_output(self) -> None:
+        while True:
+            chunk = self.proc.stdout.read(4096)
+            if not chunk:
+                break
+            with self.done:
+                self.output += chunk
+                self.done.notify_all()
+        
+        # Wake up wait() so that it does not sit out its timeout
+        with self.done:
+            self.done.notify_all()
+    
+    def send(self, command: str) -> None:
+        """
+        Send a command, or several separated by "\\r\\n", to MechGen.
+        """
+        # The write can block on a full pipe, so it must not hold self.done,
+        # which the reader thread needs to drain plink's output. The write
+        # lock keeps sequence numbers in the order they go down the pipe.
+        with self.write_lock:
+            with self.done:
+                if self.suffix_on:
+                    lines = []
+                    for line in command.split("\r\n"):
+                        self.sent += 1
+                        lines += [
+                            f"OUTPUTPREFIX {self.PREFIX.format(self.sent)}",
+                            f"OUTPUTSUFFIX {self.SUFFIX.format(self.sent)}",
+                            line,
+                        ]
+                    command = "\r\n".join(lines)
+            self.proc.stdin.write(f"{command}\r\n".encode())
+            self.proc.stdin.flush()
+    
+    def set_output_suffix(self) -> None:
+        """
+        Start marking the end of every command's output with its SUFFIX.
+        """
+        with self.done:
+            self.output.clear()
+            self.scan_from = 0
+            self.suffix_on = True
+    
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait until the SUFFIX of the last command sent so far has been read.
+        
+        Returns:
+            False if the timeout passed or plink exited first. Nothing is
+            forgotten then: markers that arrive late are read and dropped by
+            the next wait, which still waits for the newest command. A
+            command whose marker never comes only holds up waits until a
+            later command has been answered.
+        """
+        deadline = time.monotonic() + timeout
+        with self.done:
+            while self.answered < self.sent:
+                if self._next_reply(deadline) is None:
+                    return False
+        return True
+    
+    def read_replies(self, commands: List[str], timeout: float) -> List[Optional[bytes]]:
+        """
+        Send commands and return what MechGen prints for each of them.
+        
+        Each reply is matched to its command by sequence number, so markers
+        still in flight from earlier commands are read and dropped rather
+        than taken as replies.
+        
+        Returns:
+            One reply per command without its markers, or None for a
+            command whose SUFFIX did not arrive within the timeout.
+        """
+        first = self.sent + 1
+        self.send("\r\n".join(commands))
+        last = self.sent
+        
+        deadline = time.monotonic() + timeout
+        replies = {}
+        with self.done:
+            while self.answered < last:
+                reply = self._next_reply(deadline)
+                if reply is None:
+                    break
+                seq, text = reply
+                if seq >= first:
+                    replies[seq] = text
+        return [replies.get(seq) for seq in range(first, last + 1)]
+    
+    def _next_reply(self, deadline: float) -> Optional[Tuple[int, bytes]]:
+        # Caller holds self.done. Returns the sequence number of the next
+        # marker and the output in front of it.
+        while True:
+            match = self.SUFFIX_RE.search(self.output, self.scan_from)
+            if match:
+                seq = int(match.group(1))
+                reply = bytes(self.output[:match.start()])
+                del self.output[:match.end()]
+                self.scan_from = 0
+                
+                # Output of an earlier command that got no SUFFIX is left
+                # in front of this command's own PREFIX
+                prefix = self.PREFIX.format(seq).encode()
+                start = reply.rfind(prefix)
+                if start >= 0:
+                    reply = reply[start + len(prefix):]
+                
+                # Drop the line break left over from the previous SUFFIX line
+                if reply.startswith(b"\r\n"):
+                    reply = reply[2:]
+                self.answered = max(self.answered, seq)
+                return seq, reply
+            
+            # Only a marker cut off at the end of the buffer can still
+            # complete, so later searches resume just before the end
+            self.scan_from = max(0, len(self.output) - self.SUFFIX_MAX)
+            
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.proc.poll() is not None:
+                return None
+            self.done.wait(remaining)
+    
+    def close(self, timeout: int = 10) -> None:
+        """
+        Close plink's stdin so it ends the session, killing it if it hangs.
+        """
+        self.proc.stdin.close()
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def send_command(putty: Any, command: str) -> None:
+    """
+    Send a command to the PuTTY session by pasting it from the clipboard.
+    
+    Pasting costs two keystrokes whatever the command length, whereas
+    type_keys sends the command character by character. If the clipboard
+    is held by another program, the command is typed instead. Commands
+    for a PlinkSession are written to its stdin.
+    
+    Args:
+        putty: The PuTTY window handle or a PlinkSession.
+        command: The command line to send, without the trailing ENTER.
+            Several commands can be sent at once separated by "\\r\\n".
+    """
+    if isinstance(putty, PlinkSession):
+        putty.send(command)
+        return
+    
+    try:
+        with Clipboard() as clipboard:
+            clipboard.set_text(command)
+    except OSError:
+        for line in command.split("\r\n"):
+            putty.type_keys(f"{escape_smiles(line)} {{ENTER}}", with_spaces=True)
+        return
+    
+    # Shift+Insert is PuTTY's paste shortcut. PuTTY reads the clipboard
+    # only when it handles the keystroke, so give it a moment before the
+    # next command can overwrite the clipboard.
+    putty.type_keys("+{INSERT}{ENTER}")
+    time.sleep(PASTE_DELAY)
+
+
+def send_commands(putty: Any, commands: List[str]) -> None:
+    """
+    Send several commands to the PuTTY session in a single paste.
+    
+    MechGen reads its input line by line, so the commands are run in order
+    as if they had been entered one at a time.
+    
+    Args:
+        putty: The PuTTY window handle or a PlinkSession.
+        commands: The command lines to send.
+    """
+    send_command(putty, "\r\n".join(commands))
+
+
+def wait_prompt(putty: Any, timewait: int, timeout: int = 60) -> None:
+    """
+    Wait for MechGen to finish the commands sent so far.
+    
+    A PlinkSession sees the end of each command's output, so this returns
+    as soon as the last command has been answered. The PuTTY window gives
+    no such signal, so there it sleeps for timewait.
+    
+    Args:
+        putty: The PuTTY window handle or a PlinkSession.
+        timewait: Time in seconds to sleep for the PuTTY window.
+        timeout: Longest time in seconds to wait for a PlinkSession.
+    """
+    if not isinstance(putty, PlinkSession):
+        time.sleep(timewait)
+    elif not putty.wait(timeout):
+        logging.warning("...No reply from MechGen after %s s, continuing", timeout)
+
+
+def connect_to_account(host: str, port: int, username: str, password: str, timewait: int,
+                       use_plink: bool = False) -> Any:
+    """
+    Launch PuTTY (or plink) in Telnet mode and connect to the account.
+    
+    Args:
+        host: Host IP address.
+        port: Port number.
+        username: Account username.
+        password: Account password.
+        timewait: Time to wait between keystrokes.
+        use_plink: Drive MechGen through plink's stdin instead of the
+            PuTTY window.
+    
+    Returns:
+        A pywinauto window handle representing the PuTTY session, or a
+        PlinkSession if use_plink is set.
+    """
+    if use_plink:
+        session = PlinkSession(host, port)
+        
+        # Same dummy line as in PuTTY: the first command always fails
+        session.send("connect")
+        time.sleep(timewait)
+        
+        session.send(f"connect {username} {password}")
+        time.sleep(timewait)
+        session.set_output_suffix()
+        
+        logging.info("...Finished")
+        return session
+    
+    app = Application().start(f'putty -telnet {host} -P {port}')
+    putty = app.PuTTY
+    putty.wait('ready')
+    
+    # Send a dummy command since the first command always fails.
+    putty.type_keys("connect {ENTER}")
+    time.sleep(timewait)
+    
+    # Connect to the account.
+    putty.type_keys(f"connect {username} {password} {{ENTER}}", with_spaces=True)
+    time.sleep(timewait)
+    
+    logging.info("...Finished")
+    return putty
+
+
+def wait_for_file(file_path: str, wait_interval: int = 60, max_wait: int = 600, settle: float = 2) -> None:
+    """
+    Wait until the specified file exists, with a maximum timeout.
+    
+    The output folder is watched with a Win32 change notification, so the
+    wait ends as soon as the file appears; if the folder cannot be watched,
+    it is polled with intervals growing from 0.5 s to wait_interval. The
+    file is then given time to be completely written.
+    
+    Args:
+        file_path: Path to the file to wait for.
+        wait_interval: Longest interval in seconds between two checks.
+        max_wait: Maximum seconds to wait before timing out.
+        settle: Seconds the file size must stay unchanged to be complete.
+    
+    Raises:
+        TimeoutError: If the file is not found within the max_wait time.
+    """
+    if not os.path.exists(file_path):
+        handle = kernel32.FindFirstChangeNotificationW(
+            os.path.dirname(file_path) or ".", False,
+            FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_LAST_WRITE,
+        )
+        if handle in (None, INVALID_HANDLE_VALUE):
+            # The folder cannot be watched, poll for the file instead,
+            # starting with short intervals that grow up to wait_interval
+            waited = 0
+            last_logged = 0
+            interval = 0.5
+            while not os.path.exists(file_path):
+                if waited >= max_wait:
+                    raise TimeoutError("......Timeout waiting")
+                step = min(interval, max_wait - waited)
+                time.sleep(step)
+                waited += step
+                interval = min(interval * 1.5, wait_interval)
+                if waited - last_logged >= 30:
+                    logging.info("......%.1f min", waited/60)
+                    last_logged = waited
+        else:
+            try:
+                start = time.monotonic()
+                while not os.path.exists(file_path):
+                    waited = time.monotonic() - start
+                    if waited >= max_wait:
+                        raise TimeoutError("......Timeout waiting")
+                    timeout = min(wait_interval, max_wait - waited)
+                    if kernel32.WaitForSingleObject(handle, int(timeout * 1000)) == WAIT_OBJECT_0:
+                        kernel32.FindNextChangeNotification(handle)
+                    else:
+                        logging.info("......%.1f min", (time.monotonic() - start)/60)
+            finally:
+                kernel32.FindCloseChangeNotification(handle)
+    
+    # MechGen may still be appending to the file; wait until it stops growing
+    size = -1
+    while os.path.getsize(file_path) != size:
+        size = os.path.getsize(file_path)
+        time.sleep(settle)
+
+
+def stream_outputs(putty: PlinkSession, outputs: List[tuple], timeout: int = 3600) -> None:
+    """
+    Save outputs from the "read" form of their fileout commands.
+    
+    MechGen prints the result over the session instead of writing it to the
+    user folder, so nothing has to be waited for on the host's disk. The
+    manual warns that long lines are wrapped when sent to the terminal, so
+    this is only used when asked for.
+    
+    Args:
+        putty: The PlinkSession.
+        outputs: (file_type, command, file_old, file_new) entries.
+        timeout: Longest time in seconds to wait for the replies.
+    """
+    commands = ["read" + command[len("fileout"):] for _, command, _, _ in outputs]
+    replies = putty.read_replies(commands, timeout)
+    
+    for (_, _, _, file_new), reply in zip(outputs, replies):
+        if reply is None:
+            logging.warning("...No reply for %s, not saved", os.path.basename(file_new))
+            continue
+        logging.info("...Saving %s", os.path.basename(file_new))
+        with open(file_new, "wb") as f:
+            f.write(reply)
+
+
+def group_outputs(outputs: List[tuple]) -> List[List[tuple]]:
+    """
+    Split (file_type, command, file_old, file_new) entries into runs whose
+    file_old paths are all different.
+    
+    The fileouts of one run can be pasted together and then waited for in
+    turn, since none of them overwrites a file another is still writing.
+    
+    Args:
+        outputs: Output entries in the order they should be written.
+    
+    Returns:
+        The entries grouped into consecutive runs.
+    """
+    groups = []
+    targets = set()
+    for output in outputs:
+        file_old = output[2]
+        if not groups or file_old in targets:
+            groups.append([])
+            targets = set()
+        groups[-1].append(output)
+        targets.add(file_old)
+    return groups
@@ -4,76 +4,32 @@ Script for configuring MechGen and generating a multi-generation mechanism.
 Created by Jia Jiang, 2024/12/8, used for windows
 """
 
-import time
 import os
 import logging
-from pywinauto.application import Application
 from typing import Dict, List, Any
+from fun_win_session import (PlinkSession, send_commands, wait_prompt, connect_to_account,
+                             wait_for_file, stream_outputs, group_outputs)
 
 # Configure logging to include time and log level
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def escape_smiles(smiles: str) -> str:
-    """
-    Escape parentheses in the SMILES string so that pywinauto's
-    key parser interprets them as literal characters.
-    
-    Args:
-        smiles: A SMILES string.
-        
-    Returns:
-        A new SMILES string with escaped parentheses.
-    """
-    return smiles.replace("(", "{(}").replace(")", "{)}")
-
-
-def connect_to_account(host: str, port: int, username: str, password: str, timewait: int) -> Any:
-    """
-    Launch PuTTY in Telnet mode and connect to the account.
-    
-    Args:
-        host: Host IP address.
-        port: Port number.
-        username: Account username.
-        password: Account password.
-        timewait: Time to wait between keystrokes.
-    
-    Returns:
-        A pywinauto window handle representing the PuTTY session.
-    """
-    app = Application().start(f'putty -telnet {host} -P {port}')
-    putty = app.PuTTY
-    putty.wait('ready')
-    
-    # Send a dummy command since the first command always fails.
-    putty.type_keys("connect {ENTER}")
-    time.sleep(timewait)
-    
-    # Connect to the account.
-    putty.type_keys(f"connect {username} {password} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
-    
-    logging.info("...Finished")
-    return putty
-
-
 def configure_environment(putty: Any, options: Dict[str, any], timewait: int) -> None:
     """
     Configures the environmental conditions for a single-generation mechanism.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         options: A dictionary of environmental options.
         timewait: Time in seconds to wait after each command.
     """
-    putty.type_keys("Reset-options {ENTER}", with_spaces=True)
+    commands = ["Reset-options"]
     for option, value in options.items():
-        command = f"option {option} is {value} {{ENTER}}"
-        logging.info(f"...Option {option} is {value}")
-        putty.type_keys(command, with_spaces=True)
-    time.sleep(timewait)
+        logging.info("...Option %s is %s", option, value)
+        commands.append(f"option {option} is {value}")
+    send_commands(putty, commands)
+    wait_prompt(putty, timewait)
     logging.info("...Finished")
 
 
@@ -82,17 +38,17 @@ def build_compound_single(putty: Any, compound: str, smiles: str, timewait: int)
     Build and rename the target compound for multi-generation.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         compound: The user-defined name for the compound.
         smiles: The SMILES string for the compound.
         timewait: Time in seconds to wait after each command.
     """
-    safe_smiles = escape_smiles(smiles)
-    logging.info(f"...Building compound '{compound}' with SMILES: {smiles}")
-    putty.type_keys(f"Build {safe_smiles} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
-    putty.type_keys(f"Build {compound} as {safe_smiles} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
+    logging.info("...Building compound '%s' with SMILES: %s", compound, smiles)
+    send_commands(putty, [
+        f"Build {smiles}",
+        f"Build {compound} as {smiles}",
+    ])
+    wait_prompt(putty, timewait)
     
     logging.info("...Finished")
 
@@ -102,20 +58,19 @@ def configure_multi_generation(putty: Any, compound: str, multi_options: Dict[st
     Enable multi-generation mechanism for the specified compound.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         compound: The compound name.
         multi_options: Dictionary including multi-generation options like:
             - "MinYld": Minimum yield value.
             - "RxnHours": Reaction time in hours.
         timewait: Time in seconds to wait after each command.
     """
-    putty.type_keys(f"Create-MGmech {compound} {{ENTER}}", with_spaces=True)
-    
+    commands = [f"Create-MGmech {compound}"]
     for option, value in multi_options.items():
-        command = f"{option} MG-{compound} is {value} {{ENTER}}"
-        logging.info(f"...{option} MG-{compound} is {value}")
-        putty.type_keys(command, with_spaces=True)
-    time.sleep(timewait)
+        logging.info("...%s MG-%s is %s", option, compound, value)
+        commands.append(f"{option} MG-{compound} is {value}")
+    send_commands(putty, commands)
+    wait_prompt(putty, timewait)
     
     logging.info("...Finished")
 
@@ -125,69 +80,66 @@ def react_compound(putty: Any, compound: str, timewait: int) -> None:
     Initiate reactions for multi-generation mechanism on the given compound.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         compound: The compound name.
         timewait: Time in seconds to wait after each command.
     """
     logging.info("...Wait!!! Processing mechanism takes a significant amount of time")
-    putty.type_keys(f"Reset MG-{compound} {{ENTER}}", with_spaces=True)
-    putty.type_keys(f"Allreact MG-{compound} {{ENTER}}", with_spaces=True)
-
+    send_commands(putty, [
+        f"Reset MG-{compound}",
+        f"Allreact MG-{compound}",
+    ])
 
 
-def wait_for_file(file_path: str, wait_interval: int = 60, max_wait: int = 3600) -> None:
-    """
-    Wait until the specified file is created, with a maximum timeout.
-    
-    Args:
-        file_path: Path to the file to wait for.
-        wait_interval: Seconds between each check.
-        max_wait: Maximum seconds to wait before timing out.
-    
-    Raises:
-        TimeoutError: If the file is not found within the max_wait time.
-    """
-    waited = 0
-    while not os.path.exists(file_path):
-        time.sleep(wait_interval)
-        waited += wait_interval
-        logging.info(f"......{waited/60} min")
-        if waited >= max_wait:
-            raise TimeoutError("......Timeout waiting")
-
 
-def output_multi_gen_files(putty: Any, compound: str, output_types: List[str], output_dir: str, timewait: int) -> None:
+def output_multi_gen_files(putty: Any, compound: str, output_types: List[str], output_dir: str, timewait: int,
+                           stream: bool = False) -> None:
     """
     Output files for the multi-generation mechanism.
     
     Each file type is processed and the output is renamed accordingly.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         compound: The compound name.
         output_types: List of output types to generate.
         output_dir: Directory where output files are saved.
         timewait: Time in seconds to wait after each command.
+        stream: On a PlinkSession, capture the output over the session
+            instead of waiting for fileout to write it.
     """
+    mechmoo = os.path.join(output_dir, "mechmoo.dat")
+    outputs = []
     for file_type in output_types:
-        logging.info(f"...Processing file output for {file_type}")
-        
-        file_old = os.path.join(output_dir, "mechmoo.dat")
+        file_old = mechmoo
         if file_type == "List":
-            putty.type_keys(f"fileout MG-{compound} {{ENTER}}", with_spaces=True)
+            command = f"fileout MG-{compound}"
         elif file_type in ["Summary", "Cmpdinfo", "Products", "Formedby"]:
-            putty.type_keys(f"fileout {file_type} on MG-{compound} {{ENTER}}", with_spaces=True)
+            command = f"fileout {file_type} on MG-{compound}"
         elif file_type in ["Rxns", "Rxnfile"]:
-            putty.type_keys(f"fileout {file_type} on MG-{compound} {{ENTER}}", with_spaces=True)
+            command = f"fileout {file_type} on MG-{compound}"
             file_old = os.path.join(output_dir, f"MG-{compound}.rxn")
-        
+        else:
+            continue
         file_new = os.path.join(output_dir, f"{compound}_{file_type}.dat")
-        wait_for_file(file_old)
+        outputs.append((file_type, command, file_old, file_new))
+    
+    if stream and isinstance(putty, PlinkSession):
+        stream_outputs(putty, outputs)
+        logging.info("...Finished")
+        return
+    
+    for group in group_outputs(outputs):
+        send_commands(putty, [command for _, command, _, _ in group])
         
-        if os.path.exists(file_new):
-            os.remove(file_new)
-        os.rename(file_old, file_new)
-        time.sleep(timewait)
+        for file_type, _, file_old, file_new in group:
+            logging.info("...Processing file output for %s", file_type)
+            # Multi-generation outputs can take up to an hour to appear
+            wait_for_file(file_old, max_wait=3600)
+            
+            # os.replace overwrites an existing file_new in a single call
+            os.replace(file_old, file_new)
+        wait_prompt(putty, timewait)
         
     logging.info("...Finished")
     
@@ -200,6 +152,7 @@ def main() -> None:
     USERNAME = "your_username"
     PASSWORD = "your_password"
     TIMEWAIT = 2
+    USE_PLINK = False   # Send commands through plink instead of the PuTTY window
 
     # Environmental options (set OPTION_ON to True to enable)
     OPTION_ON = True
@@ -229,44 +182,52 @@ def main() -> None:
 
     # Output settings
     OUTPUT_DIR = rf"D:\MECHGEN\files\Users\{USERNAME}"
+    STREAM_ON = False    # With USE_PLINK, capture "read" output over the session (long lines wrap)
     OUTPUT_TYPES: List[str] = [
         "List","Cmpdinfo", "Summary", "Formedby",
         "Rxnfile", "Products",  
     ]
     
+    putty = None
     try:
+        # Multi-generation works on one compound at a time: the first entry
+        first = next(iter(DICT_COMPOUNDS.items()), None)
+        if first is None:
+            logging.error("DICT_COMPOUNDS is empty, add the compound to process")
+            return
+        compound, smiles = first
+        
         logging.info("Connecting to your account...")
-        putty = connect_to_account(HOST, PORT, USERNAME, PASSWORD, TIMEWAIT)
+        putty = connect_to_account(HOST, PORT, USERNAME, PASSWORD, TIMEWAIT, USE_PLINK)
         
         if OPTION_ON:
             logging.info("Configuring environmental conditions for single-generation...")
             configure_environment(putty, OPTION_LIST, TIMEWAIT)
         
         if BUILD_MULTI_ON:
-            compound, smiles = list(DICT_COMPOUNDS.items())[0]
-            logging.info(f"Building target compound '{compound}'")
+            logging.info("Building target compound '%s'", compound)
             build_compound_single(putty, compound, smiles, TIMEWAIT)
         
         if OPTION_MULTI_ON:
-            compound, _ = list(DICT_COMPOUNDS.items())[0]
-            logging.info(f"Enabling multi-generation mechanism for '{compound}'")
+            logging.info("Enabling multi-generation mechanism for '%s'", compound)
             configure_multi_generation(putty, compound, OPTION_MULTI_LIST, TIMEWAIT)
         
         if REACT_MULTI_ON:
-            compound, _ = list(DICT_COMPOUNDS.items())[0]
-            logging.info(f"Initiating reactions for multi-generation on '{compound}'")
+            logging.info("Initiating reactions for multi-generation on '%s'", compound)
             react_compound(putty, compound, TIMEWAIT)
         
         if OUTPUT_MULTI_ON:
             if os.path.exists(OUTPUT_DIR):
-                compound, _ = list(DICT_COMPOUNDS.items())[0]
-                logging.info(f"Outputting multi-generation files for '{compound}'")
-                output_multi_gen_files(putty, compound, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT)
+                logging.info("Outputting multi-generation files for '%s'", compound)
+                output_multi_gen_files(putty, compound, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT, STREAM_ON)
             else:
                logging.info("Output directory does not exist...") 
             
     except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        logging.error("An error occurred: %s", e)
+    finally:
+        if isinstance(putty, PlinkSession):
+            putty.close()
 
 
 if __name__ == "__main__":
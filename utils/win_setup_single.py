@@ -4,77 +4,32 @@ Script for configuring MechGen and generating a single-generation mechanism.
 Created by Jia Jiang, 2024/10/5, used for windows
 """
 
-import time
 import os
 import logging
-from pywinauto.application import Application
 from typing import Dict, List, Any
+from fun_win_session import (PlinkSession, send_command, send_commands, wait_prompt,
+                             connect_to_account, wait_for_file, stream_outputs, group_outputs)
 
 # Configure logging to include time and log level
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def escape_smiles(smiles: str) -> str:
-    """
-    Escape parentheses in the SMILES string so that pywinauto's
-    key parser interprets them as literal characters.
-    
-    Args:
-        smiles: A SMILES string.
-    
-    Returns:
-        A new SMILES string with escaped parentheses.
-    """
-    return smiles.replace("(", "{(}").replace(")", "{)}")
-
-
-def connect_to_account(host: str, port: int, username: str, password: str, timewait: int) -> Any:
-    """
-    Launch PuTTY in Telnet mode and connect to the account.
-    
-    Args:
-        host: Host IP address.
-        port: Port number.
-        username: Account username.
-        password: Account password.
-        timewait: Time to wait between keystrokes.
-    
-    Returns:
-        A pywinauto window handle representing the PuTTY session.
-    """
-    app = Application().start(f'putty -telnet {host} -P {port}')
-    putty = app.PuTTY
-    putty.wait('ready')
-    
-    # Send a dummy command since the first command always fails.
-    putty.type_keys("connect {ENTER}")
-    time.sleep(timewait)
-    
-    # Connect to the account.
-    putty.type_keys(f"connect {username} {password} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
-    
-    logging.info("...Finished")
-    return putty
-
-
 def configure_environment(putty: Any, options: Dict[str, Any], timewait: int) -> None:
     """
     Configures the environmental conditions.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         options: A dictionary of environmental options.
         timewait: Time in seconds to wait after each command.
     """
-    putty.type_keys("Reset-options {ENTER}", with_spaces=True)
-    
+    commands = ["Reset-options"]
     for option, value in options.items():
-        command = f"option {option} is {value} {{ENTER}}"
-        logging.info(f"...Option {option} is {value}")
-        putty.type_keys(command, with_spaces=True)
-        time.sleep(timewait)
+        logging.info("...Option %s is %s", option, value)
+        commands.append(f"option {option} is {value}")
+    send_commands(putty, commands)
+    wait_prompt(putty, timewait)
         
     logging.info("......Finished")
     
@@ -84,34 +39,35 @@ def build_compound_list(putty: Any, mix_container: str, compounds: Dict[str, str
     Builds the container and adds the list of compounds.
     
     For each compound:
-        - Build from its SMILES string (with escape applied).
+        - Build from its SMILES string.
         - Rename using the user-defined name.
         - Place the compound in the container.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         mix_container: The name of the container.
         compounds: Dictionary mapping compound names to SMILES strings.
         timewait: Time in seconds to wait after each command.
     """
+    # One paste (or plink write) for the whole list: MechGen runs the lines
+    # in order, and pasting per compound would let the next clipboard write
+    # race PuTTY's read of the previous one
     logging.info("...Creating container or clearing existing reactants.")
-    putty.type_keys(f"Create-container {mix_container} {{ENTER}}", with_spaces=True)
-    putty.type_keys(f"Zap-reactants in {mix_container} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
-    
+    commands = [
+        f"Create-container {mix_container}",
+        f"Zap-reactants in {mix_container}",
+    ]
     for compound, smiles in compounds.items():
-        safe_smiles = escape_smiles(smiles)
-        logging.info(f"...Building {compound}: {smiles}")
-        
-        putty.type_keys(f"Build {safe_smiles} {{ENTER}}", with_spaces=True)
-        time.sleep(timewait)        
-        putty.type_keys(f"Build {compound} as {safe_smiles} {{ENTER}}", with_spaces=True)
-        time.sleep(timewait)        
-        putty.type_keys(f"Put {compound} in {mix_container} {{ENTER}}", with_spaces=True)
-        time.sleep(timewait)
+        logging.info("...Building %s: %s", compound, smiles)
+        commands += [
+            f"Build {smiles}",
+            f"Build {compound} as {smiles}",
+            f"Put {compound} in {mix_container}",
+        ]
+    commands.append(f"Look {mix_container}")
     
-    putty.type_keys(f"Look {mix_container} {{ENTER}}", with_spaces=True)
-    time.sleep(timewait)
+    send_commands(putty, commands)
+    wait_prompt(putty, timewait, timeout=60 + 10 * len(compounds))
     
     logging.info("...Finished")
 
@@ -121,98 +77,111 @@ def react_compounds(putty: Any, mix_container: str, timewait: int) -> None:
     Initiates full reactions on the compounds in the specified container.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         mix_container: The name of the container.
         timewait: Time in seconds to wait after each command.
     """
-    logging.info(f"...Initiating full reaction in container {mix_container}")
+    logging.info("...Initiating full reaction in container %s", mix_container)
     logging.info("...Wait!!! Processing mechanism takes a significant amount of time")
     
-    putty.type_keys(f"fullreact in {mix_container} {{ENTER}}", with_spaces=True)
-    putty.type_keys(f"Look {mix_container} {{ENTER}}", with_spaces=True)
+    send_commands(putty, [
+        f"fullreact in {mix_container}",
+        f"Look {mix_container}",
+    ])
     
     
-def wait_for_file(file_path: str, wait_interval: int = 60, max_wait: int = 600) -> None:
-    """
-    Wait until the specified file exists, with a maximum timeout.
-    
-    Args:
-        file_path: Path to the file to wait for.
-        wait_interval: Seconds between each check.
-        max_wait: Maximum seconds to wait before timing out.
-    
-    Raises:
-        TimeoutError: If the file is not found within the max_wait time.
-    """
-    waited = 0
-    while not os.path.exists(file_path):
-        time.sleep(wait_interval)
-        waited += wait_interval
-        logging.info(f"......{waited/60} min")
-        if waited >= max_wait:
-            raise TimeoutError("......Timeout waiting")
-
-
-def output_mixture_files(putty: Any, mix_container: str, output_types: List[str], output_dir: str, timewait: int) -> None:
+def output_mixture_files(putty: Any, mix_container: str, output_types: List[str], output_dir: str, timewait: int,
+                         stream: bool = False) -> None:
     """
     Outputs files for the entire mixture in the container.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         mix_container: The container name.
         output_types: List of output types to generate.
         output_dir: Directory where output files are saved.
         timewait: Time in seconds to wait after each command.
+        stream: On a PlinkSession, capture the output over the session
+            instead of waiting for fileout to write it.
     """
-    putty.type_keys(f"Fill {mix_container} {{ENTER}}", with_spaces=True)
+    send_command(putty, f"Fill {mix_container}")
     
-    for file_type in output_types:
-        if file_type in ["List", "Summary", "Cmpdinfo", "Products", "Rxns", "Reactions"]:
-            logging.info(f"...Processing file output: {file_type}")
-            
-            file_old = os.path.join(output_dir, f"{mix_container}.rxn") if file_type == "Rxns" \
-                       else os.path.join(output_dir, "mechmoo.dat")
-            file_new = os.path.join(output_dir, f"{mix_container}_{file_type}.dat")
-            
-            putty.type_keys(f"fileout {file_type} in {mix_container} {{ENTER}}", with_spaces=True)
+    mechmoo = os.path.join(output_dir, "mechmoo.dat")
+    rxn_file = os.path.join(output_dir, f"{mix_container}.rxn")
+    outputs = [
+        (file_type,
+         f"fileout {file_type} in {mix_container}",
+         rxn_file if file_type == "Rxns" else mechmoo,
+         os.path.join(output_dir, f"{mix_container}_{file_type}.dat"))
+        for file_type in output_types
+        if file_type in ["List", "Summary", "Cmpdinfo", "Products", "Rxns", "Reactions"]
+    ]
+    
+    if stream and isinstance(putty, PlinkSession):
+        stream_outputs(putty, outputs)
+        logging.info("...Finished")
+        return
+    
+    for group in group_outputs(outputs):
+        send_commands(putty, [command for _, command, _, _ in group])
+        
+        for file_type, _, file_old, file_new in group:
+            logging.info("...Processing file output: %s", file_type)
             wait_for_file(file_old)
             
-            if os.path.exists(file_new):
-                os.remove(file_new)
-            os.rename(file_old, file_new)
+            # os.replace overwrites an existing file_new in a single call
+            os.replace(file_old, file_new)
             
     logging.info("...Finished")
 
 
-def output_single_compound_files(putty: Any, compounds: Dict[str, str], mix_container: str, output_types: List[str], output_dir: str, timewait: int) -> None:
+def output_single_compound_files(putty: Any, compounds: Dict[str, str], mix_container: str, output_types: List[str], output_dir: str, timewait: int,
+                                 stream: bool = False) -> None:
     """
     Outputs files for each individual compound in the container.
     
     Args:
-        putty: The PuTTY window handle.
+        putty: The PuTTY window handle or a PlinkSession.
         compounds: Dictionary mapping compound names to SMILES strings.
         mix_container: The container name.
         output_types: List of output types to generate.
         output_dir: Directory where output files are saved.
         timewait: Time in seconds to wait after each command.
+        stream: On a PlinkSession, capture the output over the session
+            instead of waiting for fileout to write it.
     """
-    putty.type_keys(f"Empty {mix_container} {{ENTER}}", with_spaces=True)
+    send_command(putty, f"Empty {mix_container}")
     
-    for compound in compounds:
-        for file_type in output_types:
-            if file_type in ["Products", "Rxns", "Reactions", "Prodinfo", "Processed", "Tabreactions", "Tabrxns"]:
-                logging.info(f"...Processing output for compound '{compound}' with '{file_type}'")
-                
-                file_old = os.path.join(output_dir, "mechmoo.dat")
-                file_new = os.path.join(output_dir, f"{compound}_{file_type}.dat")
-                
-                putty.type_keys(f"fileout {file_type} on {compound} {{ENTER}}", with_spaces=True)
-                time.sleep(timewait)
-                wait_for_file(file_old)
-                
-                if os.path.exists(file_new):
-                    os.remove(file_new)
-                os.rename(file_old, file_new)
+    file_old = os.path.join(output_dir, "mechmoo.dat")
+    file_types = [
+        file_type for file_type in output_types
+        if file_type in ["Products", "Rxns", "Reactions", "Prodinfo", "Processed", "Tabreactions", "Tabrxns"]
+    ]
+    outputs = [
+        (file_type,
+         f"fileout {file_type} on {compound}",
+         file_old,
+         os.path.join(output_dir, f"{compound}_{file_type}.dat"))
+        for compound in compounds
+        for file_type in file_types
+    ]
+    
+    if stream and isinstance(putty, PlinkSession):
+        # Replies come back in order, so every read can be sent at once
+        stream_outputs(putty, outputs)
+        logging.info("...Finished")
+        return
+    
+    for file_type, command, file_old, file_new in outputs:
+        logging.info("...Processing output for '%s'", os.path.basename(file_new))
+        
+        # Every output is written to mechmoo.dat, so the next fileout
+        # can only be sent once this one has been renamed
+        send_command(putty, command)
+        wait_for_file(file_old)
+        
+        # os.replace overwrites an existing file_new in a single call
+        os.replace(file_old, file_new)
     
     logging.info("...Finished")
 
@@ -225,6 +194,7 @@ def main() -> None:
     USERNAME = "your_username"
     PASSWORD = "your_password"
     TIMEWAIT = 2
+    USE_PLINK = False   # Send commands through plink instead of the PuTTY window
 
     # Environmental options (set OPTION_ON to True to enable)
     OPTION_ON = True
@@ -250,15 +220,17 @@ def main() -> None:
     
     # Output settings
     OUTPUT_DIR = rf"D:\MECHGEN\files\Users\{USERNAME}"
+    STREAM_ON = False    # With USE_PLINK, capture "read" output over the session (long lines wrap)
     OUTPUT_TYPES = [
         "List", "Summary", "Cmpdinfo",                       # Only for mixture outputs
         "Products", "Reactions", "Rxns",                     # For all types
         "Processed", "Prodinfo", "Tabreactions", "Tabrxns",  # Only for single species outputs
     ]
     
+    putty = None
     try:
         logging.info("Connecting to account...")
-        putty = connect_to_account(HOST, PORT, USERNAME, PASSWORD, TIMEWAIT)
+        putty = connect_to_account(HOST, PORT, USERNAME, PASSWORD, TIMEWAIT, USE_PLINK)
         
         if OPTION_ON:
             logging.info("Configuring environmental conditions...")
@@ -276,14 +248,17 @@ def main() -> None:
             if os.path.exists(OUTPUT_DIR):
                 logging.info("Outputting files...")
                 if OUTMIX_ON:
-                    output_mixture_files(putty, MIX_CONTAINER, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT)
+                    output_mixture_files(putty, MIX_CONTAINER, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT, STREAM_ON)
                 else:
-                    output_single_compound_files(putty, DICT_COMPOUNDS, MIX_CONTAINER, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT)
+                    output_single_compound_files(putty, DICT_COMPOUNDS, MIX_CONTAINER, OUTPUT_TYPES, OUTPUT_DIR, TIMEWAIT, STREAM_ON)
             else:
                logging.info("Output directory does not exist...") 
                 
     except Exception as e:
-        logging.error(f"An error occurred: {e}")
+        logging.error("An error occurred: %s", e)
+    finally:
+        if isinstance(putty, PlinkSession):
+            putty.close()
 
 
 if __name__ == "__main__":